@@ -4,15 +4,42 @@ import json
 import sys
 import os
 import copy
-import random
 import math
-import datetime
 import tempfile
+import concurrent.futures
+import time
+import atexit
 
 import numpy as np
 import yahoo_fin
 import yahoo_fin.stock_info
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_load_file(path):
+    # orjson parses noticeably faster for batch runs over many account files
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads( f.read() )
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _json_dump_file(path, obj):
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write( orjson.dumps(obj) )
+    else:
+        with open(path, 'w') as f:
+            json.dump(obj, f)
+
 def truncate(f, n):
     '''Truncates/pads a float f to n decimal places without rounding'''
     s = '{}'.format(f)
@@ -21,32 +48,76 @@ def truncate(f, n):
     i, p, d = s.partition('.')
     return '.'.join([i, (d+'0'*n)[:n]])
 
-def fetch_price(symbol, date_str_format = '%m/%d/%Y %H:%M:%S'):
-    cache_path = os.path.join( tempfile.gettempdir(), 'stock_price_cache.json' )
-    if os.path.isfile( cache_path ):
-        with open(cache_path, 'r') as f:
-            price_cache = json.load(f)
-    else:
-        price_cache = {}
-
-    if symbol not in price_cache or datetime.datetime.now() - datetime.datetime.strptime( price_cache[symbol]['date'], date_str_format) >= datetime.timedelta(minutes=1):
-        price_cache[symbol] = {}
-        price_cache[symbol]['price'] = yahoo_fin.stock_info.get_live_price(symbol)
-        price_cache[symbol]['date'] = datetime.datetime.now().strftime(date_str_format)
+# In-memory price cache, loaded from disk once per run and flushed at exit
+_PRICE_CACHE = None
+_PRICE_CACHE_DIRTY = False
+_PRICE_TTL_S = 60.0
 
-    with open(cache_path, 'w') as f:
-        json.dump(price_cache, f)
+def _price_cache_path():
+    return os.path.join( tempfile.gettempdir(), 'stock_price_cache.json' )
 
-    if price_cache[symbol]['price'] <= 0 or np.isnan(price_cache[symbol]['price']):
-        print(price_cache)
-        print(symbol)
-        assert( price_cache[symbol]['price'] > 0 )
-    return price_cache[symbol]['price']
+def _load_price_cache():
+    global _PRICE_CACHE
+    if _PRICE_CACHE is None:
+        cache_path = _price_cache_path()
+        if os.path.isfile( cache_path ):
+            _PRICE_CACHE = _json_load_file( cache_path )
+        else:
+            _PRICE_CACHE = {}
+    return _PRICE_CACHE
+
+def _flush_price_cache():
+    if _PRICE_CACHE_DIRTY:
+        _json_dump_file( _price_cache_path(), _PRICE_CACHE )
+
+atexit.register(_flush_price_cache)
+
+def fetch_prices(symbols):
+    '''Fetches live prices for symbols in parallel, returning a dict of symbol -> price'''
+    global _PRICE_CACHE_DIRTY
+    price_cache = _load_price_cache()
+
+    missing_symbols = []
+    for symbol in symbols:
+        # Entries from the old strftime cache format have no 'ts' and are
+        # treated as stale
+        if symbol not in price_cache or time.time() - price_cache[symbol].get('ts', 0) >= _PRICE_TTL_S:
+            missing_symbols.append( symbol )
+
+    if len(missing_symbols) > 0:
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 8) as executor:
+            # Chunk requests to stay under Yahoo's ~100 requests/minute guidance
+            for chunk_start in range(0, len(missing_symbols), 100):
+                chunk = missing_symbols[chunk_start : chunk_start + 100]
+                for symbol, price in zip( chunk, executor.map(yahoo_fin.stock_info.get_live_price, chunk) ):
+                    price_cache[symbol] = {}
+                    price_cache[symbol]['price'] = price
+                    price_cache[symbol]['ts'] = time.time()
+        _PRICE_CACHE_DIRTY = True
+
+    for symbol in symbols:
+        if price_cache[symbol]['price'] <= 0 or np.isnan(price_cache[symbol]['price']):
+            print(price_cache)
+            print(symbol)
+            assert( price_cache[symbol]['price'] > 0 )
+    return { symbol : price_cache[symbol]['price'] for symbol in symbols }
+
+def fetch_price(symbol):
+    return fetch_prices( [symbol] )[symbol]
 
 class Holding:
-    def __init__ (self, json_holding):
+    # Instances are created per JSON holding and per simulation clone, so
+    # skip the per-instance __dict__
+    __slots__ = ('_owner', '_idx', '_local_shares', 'composition', 'buy_additional', 'symbol', 'current_price', '_types')
+
+    def __init__ (self, json_holding, price_lookup = {}):
+        # Before registration with a Holdings object, shares are stored locally;
+        # afterwards they live in the owner's shared numpy array
+        self._owner = None
+        self._idx = None
         self.composition = {}
-        self.shares = float( json_holding['shares'] )
+        # json.load already yields numeric types, so no float() round-trip
+        self.shares = json_holding['shares']
         if 'buy_additional' in json_holding:
             self.buy_additional = json_holding['buy_additional']
         else:
@@ -56,12 +127,11 @@ class Holding:
             self.composition[ json_holding['type'] ] = 1.0
         elif 'composition' in json_holding:
             assert( 'type' not in json_holding )
-            for t in json_holding['composition']:
-                self.composition[t] = json_holding['composition'][t]
+            for t, frac in json_holding['composition'].items():
+                self.composition[t] = frac
         else:
             print( json_holding )
             raise Exception('"Type" or "Composition" is required')
-        assert( sum( self.composition.values() ) == 1.0 )
 
         if self.is_cash_holding():
             self.symbol = 'cash'
@@ -69,13 +139,35 @@ class Holding:
         else:
             self.symbol = json_holding['symbol']
             if 'current_price' in json_holding:
-                self.current_price = float( json_holding['current_price'] )
+                self.current_price = json_holding['current_price']
+            elif json_holding['symbol'] in price_lookup:
+                self.current_price = price_lookup[ json_holding['symbol'] ]
             else:
                 self.current_price = fetch_price( json_holding['symbol'] )
 
+        # Composition is immutable after init, so sort its keys once
+        self._types = tuple( sorted(self.composition.keys()) )
+
     def is_cash_holding(self):
         return len(self.composition) == 1 and list(self.composition.keys())[0] == 'cash'
 
+    def _register(self, owner, idx):
+        self._owner = owner
+        self._idx = idx
+
+    @property
+    def shares(self):
+        if self._owner is None:
+            return self._local_shares
+        return self._owner._shares[self._idx]
+
+    @shares.setter
+    def shares(self, value):
+        if self._owner is None:
+            self._local_shares = value
+        else:
+            self._owner.apply_delta( self._idx, value - self._owner._shares[self._idx] )
+
     def buy_shares(self, num_shares):
         self.shares += num_shares
 
@@ -84,31 +176,24 @@ class Holding:
 
     @property
     def current_value(self):
-        return self.shares * self.current_price
-
-    def get_current_values_by_type(self):
-        d = {}
-        for t in self.composition:
-            d[t] = self.composition[t] * self.current_value
-        return d
+        if self._owner is None:
+            return self._local_shares * self.current_price
+        return self._owner._shares[self._idx] * self._owner._prices[self._idx]
 
     @property
     def types(self):
-        return sorted( self.composition.keys() )
+        return self._types
 
     def __repr__ (self):
-        return_str = 'Symbol: {}\n'.format( self.symbol )
-        return_str += 'Composition:\n'
-        for t in self.composition:
-            return_str += '  {0}: {1:.2f}\n'.format( t, self.composition[t] )
-        return_str += 'Shares: {:.1f}\n'.format( self.shares )
-        return_str += 'Current price: ${:.2f}\n'.format( self.current_price )
-        return_str += 'Current value: ${:.2f}\n'.format( self.current_value )
-        if self.buy_additional:
-            return_str += 'Buy additional?: Yes\n'
-        else:
-            return_str += 'Buy additional?: No\n'
-        return return_str
+        composition_str = ''.join( [ '  {0}: {1:.2f}\n'.format(t, frac) for t, frac in self.composition.items() ] )
+        return (
+            f'Symbol: {self.symbol}\n'
+            f'Composition:\n{composition_str}'
+            f'Shares: {self.shares:.1f}\n'
+            f'Current price: ${self.current_price:.2f}\n'
+            f'Current value: ${self.current_value:.2f}\n'
+            f'Buy additional?: {"Yes" if self.buy_additional else "No"}\n'
+        )
 
     def add(self, other):
         self.__add__(other)
@@ -120,15 +205,129 @@ class Holding:
 
 
 class CashHolding(Holding):
+    __slots__ = ()
+
     def __init__ (self, starting_value = 0.0):
+        self._owner = None
+        self._idx = None
         self.composition = {'cash' : 1.0}
+        self._types = ('cash',)
         self.shares = starting_value
         self.buy_additional = False
         self.symbol = 'cash'
         self.current_price = 1.0
 
 
+def _greedy_buy_loop(shares, prices, C, targets_vec, buy_mask, type_allowed, cash_idx, num_shares):
+    '''Pure-numeric core of the rebalance buy loop, written so numba can
+    compile it when available. Mutates and returns the shares array.'''
+    num_holdings = shares.shape[0]
+    num_types = targets_vec.shape[0]
+
+    dollars = shares * prices
+    total_value = dollars.sum()
+    values_by_type = np.zeros( num_types )
+    for i in range(num_holdings):
+        for t in range(num_types):
+            values_by_type[t] += dollars[i] * C[i, t]
+
+    # Bulk pass: buy whole lots toward each underweight type's dollar
+    # shortfall up front, splitting the shortfall evenly across its
+    # candidates, so the greedy loop below only refines the remainder
+    # instead of looping once per share. When cash cannot cover the total
+    # shortfall, spread the uncoverable shortage equally across the
+    # underweight types — the equal-diff endpoint the share-by-share greedy
+    # converges to — instead of starving whichever type is filled last.
+    total_shortfall = 0.0
+    num_underweight = 0
+    for t in range(num_types):
+        if type_allowed[t]:
+            needed = targets_vec[t] * total_value - values_by_type[t]
+            if needed > 0.0:
+                total_shortfall += needed
+                num_underweight += 1
+    per_type_shortage = 0.0
+    starting_cash = shares[cash_idx] * prices[cash_idx]
+    if total_shortfall > starting_cash and num_underweight > 0:
+        per_type_shortage = (total_shortfall - starting_cash) / num_underweight
+    for t in range(num_types):
+        if not type_allowed[t]:
+            continue
+        needed = targets_vec[t] * total_value - values_by_type[t] - per_type_shortage
+        if needed <= 0.0:
+            continue
+        num_candidates = 0
+        for i in range(num_holdings):
+            if buy_mask[i] and C[i, t] > 0.0:
+                num_candidates += 1
+        if num_candidates == 0:
+            continue
+        per_candidate = needed / num_candidates
+        for i in range(num_holdings):
+            if buy_mask[i] and C[i, t] > 0.0:
+                cash = shares[cash_idx] * prices[cash_idx]
+                spend = per_candidate if per_candidate < cash else cash
+                lots = int( spend / (prices[i] * num_shares) )
+                while lots > 0 and lots * prices[i] * num_shares >= cash:
+                    lots -= 1
+                if lots > 0:
+                    delta = lots * num_shares * prices[i]
+                    shares[i] += lots * num_shares
+                    shares[cash_idx] -= delta / prices[cash_idx]
+                    for t2 in range(num_types):
+                        values_by_type[t2] += delta * (C[i, t2] - C[cash_idx, t2])
+
+    active = type_allowed.copy()
+    while True:
+        # Pick the active type furthest below its target
+        best_t = -1
+        best_diff = 0.0
+        for t in range(num_types):
+            if active[t]:
+                diff = targets_vec[t] - values_by_type[t] / total_value
+                if best_t < 0 or diff > best_diff:
+                    best_diff = diff
+                    best_t = t
+        if best_t < 0:
+            break
+
+        # Closed-form pick of the affordable candidate whose purchase brings
+        # this type's allocation closest to target
+        cash = shares[cash_idx] * prices[cash_idx]
+        best_i = -1
+        best_score = 0.0
+        for i in range(num_holdings):
+            if buy_mask[i] and C[i, best_t] > 0.0:
+                delta = prices[i] * num_shares
+                if delta < cash:
+                    new_allocation = (values_by_type[best_t] + delta * C[i, best_t]) / (total_value + delta)
+                    score = abs( new_allocation - targets_vec[best_t] )
+                    if best_i < 0 or score < best_score:
+                        best_score = score
+                        best_i = i
+
+        if best_i < 0:
+            # Nothing affordable for this type; cash only shrinks, so it
+            # stays unaffordable and can be dropped for good
+            active[best_t] = False
+            continue
+
+        delta = prices[best_i] * num_shares
+        shares[best_i] += num_shares
+        shares[cash_idx] -= delta / prices[cash_idx]
+        for t in range(num_types):
+            values_by_type[t] += delta * (C[best_i, t] - C[cash_idx, t])
+
+    return shares
+
+if numba is not None:
+    _greedy_buy_loop = numba.njit(cache = True)(_greedy_buy_loop)
+
+
 class Holdings:
+    __slots__ = ('json_holdings', 'holdings', 'cash_holding', 'symbol_map', '_types', '_type_idx',
+                 '_shares', '_prices', '_C', '_values_by_type', '_total_value', '_type_candidates')
+
     def __init__ (self, json_holdings):
         self.json_holdings = json_holdings
         self.holdings = []
@@ -137,8 +336,9 @@ class Holdings:
 
         self.symbol_map = {'cash' : self.cash_holding}
 
+        price_lookup = self._prefetch_prices()
         for h in json_holdings:
-            holding = Holding(h)
+            holding = Holding(h, price_lookup = price_lookup)
             if holding.is_cash_holding():
                 self.cash_holding.add( holding )
             else:
@@ -148,157 +348,207 @@ class Holdings:
                     self.symbol_map[holding.symbol] = holding
                     self.holdings.append( holding )
 
-        self.types_to_buy = {}
+        # Structure-of-arrays layout: shares/prices vectors and a dense
+        # holdings x types composition matrix, shared by all Holding objects
+        all_types = set()
         for h in self.holdings:
+            all_types.update( h.composition )
+        self._types = sorted( all_types )
+        self._type_idx = { t : i for i, t in enumerate(self._types) }
+        self._shares = np.zeros( len(self.holdings) )
+        self._prices = np.zeros( len(self.holdings) )
+        self._C = np.zeros( (len(self.holdings), len(self._types)) )
+        for i, h in enumerate(self.holdings):
+            self._shares[i] = h.shares
+            self._prices[i] = h.current_price
+            for t, frac in h.composition.items():
+                self._C[i, self._type_idx[t]] = frac
+            h._register(self, i)
+
+        # Running totals, updated incrementally by apply_delta so the
+        # rebalance loop never recomputes them from scratch
+        self._values_by_type = self._C.T @ (self._shares * self._prices)
+        self._total_value = float( np.vdot(self._shares, self._prices) )
+        # assert_allclose is not an assert statement, so gate it explicitly
+        # to keep -O runs validation-free
+        if __debug__:
+            self._validate()
+
+        # Candidate rows for each buyable type, as index arrays into the
+        # shares/prices/composition arrays
+        type_candidate_lists = {}
+        for i, h in enumerate(self.holdings):
             if h.buy_additional:
                 for holding_type in h.types:
                     if holding_type != 'cash' and holding_type != 'other':
-                        if holding_type not in self.types_to_buy:
-                            self.types_to_buy[holding_type] = []
-                        self.types_to_buy[holding_type].append(h)
+                        if holding_type not in type_candidate_lists:
+                            type_candidate_lists[holding_type] = []
+                        type_candidate_lists[holding_type].append(i)
+        self._type_candidates = { t : np.array(idxs, dtype = np.intp) for t, idxs in type_candidate_lists.items() }
+
+    def _validate(self):
+        # Each composition must sum to 1, checked with a tolerance across all
+        # holdings at once rather than exact float equality per holding
+        np.testing.assert_allclose( self._C.sum(axis = 1), 1.0, atol = 1e-9 )
+
+    def _prefetch_prices(self):
+        # Batch all symbols that will need a live price into one parallel fetch,
+        # instead of hitting Yahoo serially per holding
+        symbols_to_fetch = []
+        for h in self.json_holdings:
+            if 'symbol' in h and 'current_price' not in h and h['symbol'] not in symbols_to_fetch:
+                symbols_to_fetch.append( h['symbol'] )
+        if len(symbols_to_fetch) == 0:
+            return {}
+        return fetch_prices( symbols_to_fetch )
 
     def copy (self):
         return Holdings(self.json_holdings)
 
+    def clone_for_simulation(self):
+        # Lightweight copy for the rebalance loop: only the mutable share
+        # state is duplicated, while prices, the composition matrix, and the
+        # candidate index arrays are shared read-only with the original.
+        # Avoids re-parsing the JSON holdings (and potentially re-fetching
+        # prices) that a full copy() would trigger.
+        clone = Holdings.__new__( Holdings )
+        clone.json_holdings = self.json_holdings
+        clone._types = self._types
+        clone._type_idx = self._type_idx
+        clone._prices = self._prices
+        clone._C = self._C
+        clone._type_candidates = self._type_candidates
+        clone._shares = self._shares.copy()
+        clone._values_by_type = self._values_by_type.copy()
+        clone._total_value = self._total_value
+        clone.holdings = []
+        clone.symbol_map = {}
+        for h in self.holdings:
+            new_holding = copy.copy( h )
+            new_holding._register( clone, h._idx )
+            clone.holdings.append( new_holding )
+            clone.symbol_map[new_holding.symbol] = new_holding
+        clone.cash_holding = clone.symbol_map['cash']
+        return clone
+
     @property
     def cash(self):
         return self.cash_holding.shares
 
+    def apply_delta(self, holding_idx, delta_shares):
+        # A buy/sell changes exactly one shares entry, so the cached totals
+        # can be updated in O(T) instead of recomputed in O(H*T)
+        delta_dollars = delta_shares * self._prices[holding_idx]
+        self._shares[holding_idx] += delta_shares
+        self._values_by_type += delta_dollars * self._C[holding_idx]
+        self._total_value += delta_dollars
+
     @property
     def current_value(self):
-        s = 0.0
-        for holding in self.holdings:
-            s += holding.current_value
-        return s
+        return self._total_value
 
     def get_current_value_by_type(self):
-        dollar_values = {}
-        for holding in self.holdings:
-            holding_current_values_by_type = holding.get_current_values_by_type()
-            for t in holding_current_values_by_type:
-                if t not in dollar_values:
-                    dollar_values[t] = 0.0
-                dollar_values[t] += holding_current_values_by_type[t]
-        return dollar_values
+        return dict( zip( self._types, self._values_by_type ) )
 
     def get_current_allocations(self):
-        current_value_by_type = self.get_current_value_by_type()
-        current_value = self.current_value
-        d = {}
-        for t in current_value_by_type:
-            d[t] = current_value_by_type[t] / current_value
-        return Proportions(d)
-
-    def buy_type(self, type_to_buy, target_allocation, num_shares = 1):
-        num_shares = float( num_shares )
-        potential_holdings_to_buy = list(self.types_to_buy[type_to_buy])
-        holdings_we_can_afford_to_buy = []
-        for h in potential_holdings_to_buy:
-            new_price = h.current_price * num_shares
-            if new_price < self.cash:
-                holdings_we_can_afford_to_buy.append( h )
-
-        if len( holdings_we_can_afford_to_buy ) == 0:
-            return False
+        return Proportions( dict( zip( self._types, self._values_by_type / self._total_value ) ) )
 
-        diffs_after_purchase = []
-        for h in holdings_we_can_afford_to_buy:
-            h.buy_shares( num_shares )
-            new_allocation = self.get_current_allocations().get_type(type_to_buy)
-            allocation_diff = abs( new_allocation - target_allocation )
-            h.sell_shares( num_shares )
-            diffs_after_purchase.append( (allocation_diff, h) )
-
-        if len(diffs_after_purchase) > 0:
-            holding_to_buy = diffs_after_purchase[0][1]
-            holding_to_buy.buy_shares( num_shares )
-            self.cash_holding.sell_shares( holding_to_buy.current_price * num_shares )
-            return True
-        else:
+    def buy_type(self, type_to_buy, target_allocation, num_shares = 1.0):
+        idx = self._type_candidates[type_to_buy]
+        idx = idx[ self._prices[idx] * num_shares < self.cash ]
+        if len(idx) == 0:
             return False
 
-    def sell_type(self, type_to_sell, num_shares = 1):
-        num_shares = float( num_shares )
-        # Note: this should really measure proportions within category somehow
-        holding_to_sell = random.choice( list(self.types_to_buy[type_to_sell]) )
+        # The post-purchase allocation of a type is an affine function of the
+        # purchase cost, so the best candidate can be picked in closed form
+        # instead of trial-buying and reverting each one
+        t_col = self._type_idx[type_to_buy]
+        deltas = self._prices[idx] * num_shares
+        new_allocations = (self._values_by_type[t_col] + deltas * self._C[idx, t_col]) / (self._total_value + deltas)
+
+        holding_to_buy = self.holdings[ int( idx[np.argmin(np.abs(new_allocations - target_allocation))] ) ]
+        holding_to_buy.buy_shares( num_shares )
+        self.cash_holding.sell_shares( holding_to_buy.current_price * num_shares )
+        return True
+
+    def sell_type(self, type_to_sell, num_shares = 1.0):
+        # Sell from the holding carrying the most dollars of this type, so the
+        # sell loop converges deterministically instead of by random choice
+        idx = self._type_candidates[type_to_sell]
+        t_col = self._type_idx[type_to_sell]
+        holding_to_sell = self.holdings[ int( idx[np.argmax(self._shares[idx] * self._prices[idx] * self._C[idx, t_col])] ) ]
 
         holding_to_sell.sell_shares( num_shares )
         self.cash_holding.buy_shares( holding_to_sell.current_price * num_shares )
 
     def get_shares_diffs(self, other):
-        shares_diffs = []
-        for other_holding in other.holdings:
-            other_symbol = other_holding.symbol
-            if other_symbol not in self.symbol_map:
-                shares_diffs.append( (other_holding.shares, other_symbol) )
-            else:
-                shares_diffs.append( (other_holding.shares - self.symbol_map[other_symbol].shares, other_symbol) )
-        return shares_diffs
+        # Parallel (diffs, symbols) arrays aligned with other.holdings
+        symbols = [other_holding.symbol for other_holding in other.holdings]
+        diffs = np.array( [other_holding.shares - self.symbol_map[other_holding.symbol].shares if other_holding.symbol in self.symbol_map else other_holding.shares for other_holding in other.holdings] )
+        return diffs, symbols
 
     def shares_diff(self, other):
-        r = ''
-        shares_diffs = self.get_shares_diffs(other)
-        shares_diffs.sort(reverse = True)
-        for shares_diff, symbol in shares_diffs:
+        parts = []
+        diffs, symbols = self.get_shares_diffs(other)
+        for shares_diff, symbol in sorted( zip(diffs, symbols), reverse = True ):
             if shares_diff != 0.0:
                 if symbol == 'cash':
-                    r += '{}: ${}, '.format(symbol, shares_diff)
+                    parts.append( '{}: ${}'.format(symbol, shares_diff) )
                 else:
-                    r += '{}: {}, '.format(symbol, shares_diff)
-        return r.strip()[:-1]
+                    parts.append( '{}: {}'.format(symbol, shares_diff) )
+        return ', '.join( parts )
 
     def limit_prices(self, other):
         # Give extra cash to each type of new investment, proportioned based on how much
         # that symbol costs
-        shares_diffs = self.get_shares_diffs(other)
-        shares_diffs_map = {}
-        total_symbol_costs = sum( [self.symbol_map[symbol].current_price for shares_diff, symbol in shares_diffs if symbol != 'cash' and symbol != 'other' and shares_diff != 0.0] )
-        shares_proportionality = {}
-        for shares_diff, symbol in shares_diffs:
-            if symbol != 'cash' and symbol != 'other' and shares_diff > 0:
-                shares_proportionality[symbol] = self.symbol_map[symbol].current_price / total_symbol_costs
-                shares_diffs_map[symbol] = shares_diff
-        limit_prices = []
-        for symbol, proportion in shares_proportionality.items():
-            limit_prices.append( (proportion * other.cash / shares_diffs_map[symbol] + self.symbol_map[symbol].current_price, symbol) )
+        diffs, symbols = self.get_shares_diffs(other)
+        prices = np.array( [self.symbol_map[symbol].current_price for symbol in symbols] )
+        tradeable = np.array( [symbol != 'cash' and symbol != 'other' for symbol in symbols] )
+        total_symbol_costs = prices[tradeable & (diffs != 0.0)].sum()
+        buy_idx = np.nonzero( tradeable & (diffs > 0) )[0]
+        limits = prices[buy_idx] / total_symbol_costs * other.cash / diffs[buy_idx] + prices[buy_idx]
         print( 'Limit prices:' )
-        for limit_price, symbol in limit_prices:
-            print( '{}: {} ({:d} shares)'.format(symbol, truncate(limit_price, 2), math.ceil(shares_diffs_map[symbol])) )
+        for i, limit_price in zip(buy_idx, limits):
+            print( '{}: {} ({:d} shares)'.format(symbols[i], truncate(limit_price, 2), math.ceil(diffs[i])) )
         print()
 
     def spend_cash_to_balance(self, targets, sell_shares = False):
-        new_holdings = self.copy()
+        new_holdings = self.clone_for_simulation()
 
         if sell_shares:
-            diffs = sorted( [(y, x) for x,y in targets.diff( new_holdings.get_current_allocations() ).items()], reverse = False )
+            # Compute allocations once per iteration and reuse for both the
+            # diffs sort and the cash check
+            allocations = new_holdings.get_current_allocations()
+            diffs = sorted( [(y, x) for x,y in targets.diff( allocations ).items()], reverse = False )
             total_buy_diff = 0.0
             for diff, diff_name in diffs:
                 if diff > 0:
                     total_buy_diff += diff
 
-            cash_diff = new_holdings.get_current_allocations().get_type('cash')
+            cash_diff = allocations.get_type('cash')
             while total_buy_diff > cash_diff:
-                diffs = sorted( [(y, x) for x,y in targets.diff( new_holdings.get_current_allocations() ).items()], reverse = False )
                 for diff, diff_name in diffs:
                     if diff_name != 'cash':
                         new_holdings.sell_type( diff_name )
                         break
-                cash_diff = new_holdings.get_current_allocations().get_type('cash')
+                allocations = new_holdings.get_current_allocations()
+                diffs = sorted( [(y, x) for x,y in targets.diff( allocations ).items()], reverse = False )
+                cash_diff = allocations.get_type('cash')
             # diffs = sorted( [(y, x) for x,y in targets.diff( new_holdings.get_current_allocations() ).items()], reverse = False )
             # print( diffs )
             # sys.exit()
 
-        while True:
-            allocations = new_holdings.get_current_allocations()
-            diffs = sorted( [(y, x) for x,y in targets.diff( allocations ).items()], reverse = True )
-            purchase_successful = False
-            for allocation_diff, type_to_buy in diffs:
-                if type_to_buy != 'cash' and type_to_buy != 'other':
-                    if new_holdings.buy_type(type_to_buy, targets.get_type(type_to_buy)):
-                        purchase_successful = True
-                        break
-            if not purchase_successful:
-                break
+        # Run the greedy buy loop as a pure-numeric kernel over the SoA
+        # arrays (numba-compiled when available), then apply the resulting
+        # share deltas back through apply_delta for the reporting below
+        targets_vec = np.array( [targets.proportions.get(t, 0.0) for t in new_holdings._types] )
+        buy_mask = np.array( [h.buy_additional for h in new_holdings.holdings] )
+        type_allowed = np.array( [t != 'cash' and t != 'other' for t in new_holdings._types] )
+        final_shares = _greedy_buy_loop( new_holdings._shares.copy(), new_holdings._prices, new_holdings._C,
+                                         targets_vec, buy_mask, type_allowed, new_holdings.cash_holding._idx, 1.0 )
+        share_deltas = final_shares - new_holdings._shares
+        for i in np.nonzero( share_deltas )[0]:
+            new_holdings.apply_delta( int(i), float(share_deltas[i]) )
 
         print( 'New shares to buy:' )
         print( self.shares_diff(new_holdings) )
@@ -309,8 +559,13 @@ class Holdings:
         print( 'diffs after purchasing:', targets.diff( new_holdings.get_current_allocations() ) )
 
 class Proportions:
+    __slots__ = ('proportions', '_sorted_types')
+
     def __init__ (self, proportions):
         self.proportions = proportions
+        # Proportions are immutable after construction, so sort the keys once
+        # for __repr__ instead of per call
+        self._sorted_types = sorted( proportions.keys() )
 
     def items(self):
         return self.proportions.items()
@@ -319,38 +574,35 @@ class Proportions:
         return self.proportions[t]
 
     def diff(self, other):
-        new_proportions_dict = copy.deepcopy(self.proportions)
-        for other_type in other.proportions:
-            if other_type in new_proportions_dict:
-                new_proportions_dict[other_type] -= other.proportions[other_type]
-            else:
-                new_proportions_dict[other_type] = 0.0 - other.proportions[other_type]
+        # Values are flat floats, so a shallow copy is all that is needed
+        new_proportions_dict = dict(self.proportions)
+        for other_type, proportion in other.proportions.items():
+            new_proportions_dict[other_type] = new_proportions_dict.get(other_type, 0.0) - proportion
         return Proportions(new_proportions_dict)
 
     def __repr__ (self):
-        r = ''
-        for t in sorted(self.proportions.keys()):
-            r += "'{0}': {1:.4f}, ".format( t, self.proportions[t] )
-        r = r.strip()[:-1]
-        return r
+        return ', '.join( ["'{0}': {1:.4f}".format( t, self.proportions[t] ) for t in self._sorted_types] )
 
 
 class JSONProportions(Proportions):
+    __slots__ = ()
+
     def __init__ (self, json_proportions):
-        self.proportions = {}
+        proportions = {}
         for holding_type in json_proportions:
             if holding_type == 'stocks':
                 assert( 'us_stocks' not in json_proportions )
                 assert( 'int_stocks' not in json_proportions )
-                self.proportions['us_stocks'] = 0.8* float( json_proportions['stocks'] )
-                self.proportions['int_stocks'] = 0.2* float( json_proportions['stocks'] )
+                proportions['us_stocks'] = 0.8* float( json_proportions['stocks'] )
+                proportions['int_stocks'] = 0.2* float( json_proportions['stocks'] )
             elif holding_type == 'stocks_esg':
                 assert( 'us_stocks_esg' not in json_proportions )
                 assert( 'int_stocks_esg' not in json_proportions )
-                self.proportions['us_stocks_esg'] = 0.8* float( json_proportions['stocks_esg'] )
-                self.proportions['int_stocks_esg'] = 0.2* float( json_proportions['stocks_esg'] )
+                proportions['us_stocks_esg'] = 0.8* float( json_proportions['stocks_esg'] )
+                proportions['int_stocks_esg'] = 0.2* float( json_proportions['stocks_esg'] )
             else:
-                self.proportions[holding_type] = float( json_proportions[holding_type] )
+                proportions[holding_type] = float( json_proportions[holding_type] )
+        super().__init__( proportions )
 
 
 def balance_account( json_account, name ):
@@ -370,8 +622,7 @@ def main():
     for account_file in sys.argv[1:]:
         assert( os.path.isfile(account_file) )
         names.append( os.path.basename(account_file) )
-        with open(account_file) as f:
-            accounts.append( json.load(f) )
+        accounts.append( _json_load_file(account_file) )
 
     for account, name in zip(accounts, names):
         balance_account( account, name )